@@ -1,5 +1,8 @@
+import concurrent.futures
 import csv
+import functools
 import itertools
+import os
 import sys
 
 PROBS = {
@@ -36,6 +39,29 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Lookup tables built from PROBS, indexed by the number of copies of the gene
+# Unconditional probability of having the gene
+GENE_PROB = tuple(PROBS["gene"][gene] for gene in range(3))
+
+# Probability of not having / having the trait, indexed by `has_trait`
+TRAIT_PROB = tuple(
+    (PROBS["trait"][gene][False], PROBS["trait"][gene][True])
+    for gene in range(3)
+)
+
+# Probability that a parent passes the gene on to their child
+PASS_PROB = (
+    PROBS["mutation"],
+    0.5 - PROBS["mutation"],
+    1 - PROBS["mutation"]
+)
+
+# Number of gene assignments above which they are summed in parallel (when
+# more than one CPU is available), split into parts by the gene counts of
+# the first PARALLEL_DEPTH people
+PARALLEL_THRESHOLD = 3 ** 12
+PARALLEL_DEPTH = 3
+
 
 def main():
 
@@ -48,43 +74,66 @@ def main():
     # p = joint_probability(people, {"Harry"}, {"James"}, {"James"})
     # print(p)
 
-    # Keep track of gene and trait probabilities for each person
+    names = parents_first(people)
+    factors = factor_tables(people, names)
+
+    # Probability of each person's known trait given their gene count.
+    # A person whose trait is unknown could have it or not, and the two
+    # probabilities sum to 1, so they do not rule out any assignment.
+    trait_probs = [
+        [
+            TRAIT_PROB[gene][people[person]["trait"]]
+            if people[person]["trait"] is not None else 1
+            for gene in range(3)
+        ]
+        for person in names
+    ]
+
+    # Sum the joint probabilities for each person and gene count. Large
+    # enumerations are split into independent parts that are summed in
+    # separate processes, if there is more than one CPU to run them on.
+    parallel = (os.cpu_count() or 1) > 1
+    if parallel and 3 ** len(names) > PARALLEL_THRESHOLD:
+        prefixes = itertools.product(range(3), repeat=PARALLEL_DEPTH)
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            parts = list(executor.map(
+                functools.partial(sum_joints, factors, trait_probs), prefixes
+            ))
+    else:
+        parts = [sum_joints(factors, trait_probs)]
+
+    # Keep track of gene and trait probabilities for each person in `names`,
+    # with traits indexed by `has_trait`
+    gene_totals = [[0, 0, 0] for person in names]
+    trait_totals = [[0, 0] for person in names]
+
+    # Update probabilities with the joint probabilities
+    for gene_sums, total in parts:
+        for i, person in enumerate(names):
+            for gene in range(3):
+                gene_totals[i][gene] += gene_sums[i][gene]
+
+            # known traits hold in every assignment; otherwise the trait
+            # only depends on the person's gene count
+            trait = people[person]["trait"]
+            if trait is not None:
+                trait_totals[i][trait] += total
+            else:
+                for gene in range(3):
+                    for value in (False, True):
+                        trait_totals[i][value] += (
+                            gene_sums[i][gene] * TRAIT_PROB[gene][value]
+                        )
+
+    # Copy the totals into a dictionary of distributions for each person
     probabilities = {
         person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
+            "gene": {gene: gene_totals[i][gene] for gene in (2, 1, 0)},
+            "trait": {value: trait_totals[i][value] for value in (True, False)}
         }
-        for person in people
+        for i, person in enumerate(names)
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
-
     # Ensure probabilities sum to 1
     normalize(probabilities)
 
@@ -122,15 +171,139 @@ def load_data(filename):
 
 def powerset(s):
     """
-    Return a list of all possible subsets of set s.
+    Return a generator over all possible subsets of set s.
+    Subsets are created one at a time, as they are needed.
     """
     s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
+    return (
+        set(subset) for subset in itertools.chain.from_iterable(
             itertools.combinations(s, r) for r in range(len(s) + 1)
         )
+    )
+
+
+def parents_first(people):
+    """
+    Return a list of the names in `people`, ordered so that every
+    person comes after both of their parents.
+    """
+    order = list()
+    seen = set()
+
+    def visit(person):
+        if person in seen:
+            return
+        seen.add(person)
+        for parent in (people[person]["mother"], people[person]["father"]):
+            if parent is not None:
+                visit(parent)
+        order.append(person)
+
+    for person in people:
+        visit(person)
+    return order
+
+
+@functools.lru_cache(maxsize=None)
+def inherit_prob(mother_genes, father_genes, genes):
+    """
+    Return the probability that a child has `genes` copies of the gene,
+    given that their mother has `mother_genes` copies and their father
+    has `father_genes` copies.
+    """
+    pm = PASS_PROB[mother_genes]        # prob from mother
+    pnm = 1 - pm                        # prob not from mother
+    pf = PASS_PROB[father_genes]        # prob from father
+    pnf = 1 - pf                        # prob not from father
+
+    if genes == 1:
+        # option 1 - gets the gene from the mother and not the father
+        # option 2 - gets the gene from the father and not the mother
+        return pm * pnf + pf * pnm
+    elif genes == 2:
+        # gets the gene from both the mother and the father
+        return pm * pf
+    else:
+        # does not get the gene from neither the mother or the father
+        return pnm * pnf
+
+
+def factor_tables(people, names):
+    """
+    Precompute the probability of each person's gene count.
+
+    Return a list with one `(table, mother, father)` entry per person in
+    `names`. For people without parents, `mother` and `father` are None
+    and the probability is `table[gene]`. Otherwise `mother` and `father`
+    are the indices of the parents in `names` and the probability is
+    `table[mother_gene][father_gene][gene]`.
+    """
+    index = {name: i for i, name in enumerate(names)}
+
+    # every child shares the same table of inheritance probabilities
+    inherit_table = [
+        [[inherit_prob(mg, fg, gene) for gene in range(3)] for fg in range(3)]
+        for mg in range(3)
     ]
 
+    factors = list()
+    for person in names:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+
+        if mother is None:
+            factors.append((GENE_PROB, None, None))
+        else:
+            factors.append((inherit_table, index[mother], index[father]))
+
+    return factors
+
+
+def sum_joints(factors, trait_probs, prefix=()):
+    """
+    Sum the joint probabilities of every assignment of gene counts to
+    people in which the first people have the gene counts in `prefix`.
+
+    `factors` is the list returned by `factor_tables`, with parents
+    listed before their children, and `trait_probs[i][gene]` is the
+    probability of person i's trait given their gene count.
+
+    Return a tuple `(gene_sums, total)`, where `gene_sums[i][gene]` is
+    the sum over the assignments in which person i has `gene` copies of
+    the gene, and `total` is the sum over all of them.
+
+    Assignments are built one person at a time, so the product for a
+    shared prefix of people is only computed once, and each person's sums
+    are added once per prefix instead of once per full assignment.
+    """
+    n = len(factors)
+    genes = [0] * n
+    gene_sums = [[0, 0, 0] for factor in factors]
+
+    def extend(i, p):
+        """
+        Return the sum, over the gene counts of people i onwards, of the
+        product of their factors, where `p` is the product of the factors
+        of the people before i.
+        """
+        if i == n:
+            return 1
+        table, mother, father = factors[i]
+        if mother is not None:
+            table = table[genes[mother]][genes[father]]
+
+        s = 0
+        for gene in (prefix[i],) if i < len(prefix) else range(3):
+            genes[i] = gene
+            factor = table[gene] * trait_probs[i][gene]
+            rest = factor * extend(i + 1, p * factor)
+            gene_sums[i][gene] += p * rest
+            s += rest
+        return s
+
+    total = extend(0, 1)
+    return gene_sums, total
+
 
 def joint_probability(people, one_gene, two_genes, have_trait):
     """
@@ -143,70 +316,32 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone in set `have_trait` has the trait, and
         * everyone not in set `have_trait` does not have the trait.
     """
+    # look up how many copies of the gene each person has only once
+    genes = dict()
+    for person in people:
+        if person in one_gene:
+            genes[person] = 1
+        elif person in two_genes:
+            genes[person] = 2
+        else:
+            genes[person] = 0
+
     final_prob = 1
 
     for person in people:
-        prob_gene = 0
-        prob_trait = 0
-        prob = 0
+        gene = genes[person]
 
         # compute prob_gene
         # check if the person has parents
-        if people[person]['mother'] != None:
+        if people[person]['mother'] is not None:
             mother = people[person]['mother']
             father = people[person]['father']
-
-            pm = 0      # prob from mother
-            pnm = 0     # prob not from mother
-            pf = 0      # prob from father
-            pnf = 0     # prob not from father
-
-            if mother in one_gene:
-                pm = 0.5 - PROBS["mutation"]
-            elif mother in two_genes:
-                pm = 1 - PROBS["mutation"]
-            else:
-                pm = PROBS["mutation"]
-            pnm = 1 - pm
-
-            if father in one_gene:
-                pf = 0.5 - PROBS["mutation"]
-            elif father in two_genes:
-                pf = 1 - PROBS["mutation"]
-            else:
-                pf = PROBS["mutation"]
-            pnf = 1 - pf
-
-            if person in one_gene:
-                # option 1 - gets the gene from the mother and not the father
-                # option 2 - gets the gene from the father and not the mother
-                prob_gene = pm * pnf + pf * pnm
-            elif person in two_genes:
-                # gets the gene from both the mother and the father
-                prob_gene = pm * pf
-            else:
-                # does not get the gene from neither the mother or the father
-                prob_gene = pnm * pnf
+            prob_gene = inherit_prob(genes[mother], genes[father], gene)
         else:
-            if person in one_gene:
-                prob_gene = PROBS["gene"][1]
-            elif person in two_genes:
-                prob_gene = PROBS["gene"][2]
-            else:
-                prob_gene = PROBS["gene"][0]
+            prob_gene = GENE_PROB[gene]
 
         # compute prob_trait
-        gene = 0
-        if person in one_gene:
-            gene = 1
-        elif person in two_genes:
-            gene = 2
-
-        trait = False
-        if person in have_trait:
-            trait = True
-        
-        prob_trait = PROBS["trait"][gene][trait]
+        prob_trait = TRAIT_PROB[gene][person in have_trait]
 
         prob = prob_gene * prob_trait
         final_prob *= prob
@@ -241,19 +376,11 @@ def normalize(probabilities):
     is normalized (i.e., sums to 1, with relative proportions the same).
     """
     for person in probabilities:
-        # update gene probabilities
-        prob_sum = 0
-        for gene in range(3):
-            prob_sum += probabilities[person]["gene"][gene]
-        constant = 1 / prob_sum
-        for gene in range(3):
-            probabilities[person]["gene"][gene] *= constant
-
-        # update trait probabilities
-        prob_sum = (probabilities[person]["trait"][False] + probabilities[person]["trait"][True])
-        constant = 1 / prob_sum
-        probabilities[person]["trait"][False] *= constant
-        probabilities[person]["trait"][True] *= constant
+        # update gene and trait probabilities
+        for distribution in probabilities[person].values():
+            constant = 1 / sum(distribution.values())
+            for value in distribution:
+                distribution[value] *= constant
 
 
 if __name__ == "__main__":
@@ -5,6 +5,10 @@ import sys
 
 DAMPING = 0.85
 SAMPLES = 10000
+THRESHOLD = 0.001
+
+# Matches the target of every link in a (bytes) HTML document
+LINK_RE = re.compile(rb"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
 
 
 def main():
@@ -33,10 +37,10 @@ def crawl(directory):
     for filename in os.listdir(directory):
         if not filename.endswith(".html"):
             continue
-        with open(os.path.join(directory, filename)) as f:
+        with open(os.path.join(directory, filename), "rb") as f:
             contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+            links = set(LINK_RE.findall(contents))
+            pages[filename] = {link.decode() for link in links} - {filename}
 
     # Only include links to other pages in the corpus
     for filename in pages:
@@ -57,31 +61,20 @@ def transition_model(corpus, page, damping_factor):
     linked to by `page`. With probability `1 - damping_factor`, choose
     a link at random chosen from all pages in the corpus.
     """
-    # initialize model dictionary
-    model = dict()
-    for new_page in corpus:
-        model[new_page] = 0
-
-    # calculate probabilities
-    # check if the page has any outgoing links
+    length = len(corpus)
     num = len(corpus[page])
-    if num != 0:
-        # add the probability for the outgoing links
-        for new_page in corpus[page]:
-            model.update({new_page: DAMPING / num})
 
-        # add the probability for all the pages
-        length = len(corpus)
-        for new_page in corpus:
-            model.update({new_page: model[new_page] + (1-DAMPING) / length})
-    else:
-        # if the page has no outgoing links, then choose any page at random
-        length = len(corpus)
-        for new_page in corpus:
-            model.update({new_page: 1/length})
+    # if the page has no outgoing links, then choose any page at random
+    if num == 0:
+        return dict.fromkeys(corpus, 1 / length)
 
-    # print(model)
-    return(model)
+    # add the probability for all the pages, then for the outgoing links
+    model = dict.fromkeys(corpus, (1 - damping_factor) / length)
+    link_prob = damping_factor / num
+    for new_page in corpus[page]:
+        model[new_page] += link_prob
+
+    return model
 
 
 def sample_pagerank(corpus, damping_factor, n):
@@ -93,42 +86,33 @@ def sample_pagerank(corpus, damping_factor, n):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    # initialize page_rank dicitionary
-    page_rank = dict()
-    for page in corpus:
-        page_rank[page] = 0
+    # initialize tuple with all the pages
+    pages = tuple(corpus)
+    length = len(pages)
+
+    # for every page, a list with the indices of the pages it links to
+    index = {page: i for i, page in enumerate(pages)}
+    links = [[index[page2] for page2 in corpus[page]] for page in pages]
 
-    # initialize list with all the pages
-    pageList = list()
-    for page in corpus:
-        pageList.append(page)
+    # number of times each page was visited
+    counts = [0] * length
 
     # randomly choose the first page
-    # length = len(corpus)
-    # random_num = random.randint(1, length)
-    # page = str(random_num) + '.html'
-    page = random.choice(list(corpus.items()))
-    page = page[0]
-    page_rank.update({page: page_rank[page] + 1})
+    page = random.randrange(length)
+    counts[page] += 1
 
     for i in range(n-1):
-        # get the transition model for the current page
-        model = transition_model(corpus, page, damping_factor)
-
-        # create a list with the probabilities
-        prob = list()
-        for page2 in pageList:
-            prob.append(model[page2])
-
-        # get the next page
-        page = random.choices(pageList, weights=prob, k=1)
-        page = page[0]
-
-        page_rank.update({page: page_rank[page] + 1})
+        # with probability `damping_factor` follow one of the page's links,
+        # otherwise (or if the page has no links) go to any page at random
+        page_links = links[page]
+        if page_links and random.random() < damping_factor:
+            page = page_links[random.randrange(len(page_links))]
+        else:
+            page = random.randrange(length)
+        counts[page] += 1
 
     # calculate the page rank
-    for page in page_rank:
-        page_rank.update({page: page_rank[page] / n})
+    page_rank = {pages[i]: counts[i] / n for i in range(length)}
 
     # print(page_rank)
     return page_rank
@@ -143,40 +127,47 @@ def iterate_pagerank(corpus, damping_factor):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    # initialize page_rank dictionary
-    page_rank = dict()
-    n = len(corpus)
-    for page in corpus:
-        page_rank[page] = 1 / n
-
-    # create a dictionary where the key is a page p, and the value is a set with all the pages that link to page p
-    page_link = dict()
-    for page in corpus:
-        page_link[page] = set()
-
-    for page in corpus:
+    pages = list(corpus)
+    n = len(pages)
+    index = {page: i for i, page in enumerate(pages)}
+
+    # in a single pass over the links, build for every page p a list with
+    # the indices of all the pages that link to page p, and count the
+    # outgoing links of every page
+    page_link = [list() for page in pages]
+    num_links = [0] * n
+    for i, page in enumerate(pages):
         for page2 in corpus[page]:
-            page_link[page2].add(page)
-
-    ok = False
-    while ok == False:
-        ok = True
-        for page in corpus:
-            new_rank = (1 - damping_factor) / n
-            s = 0
-
-            for parent_page in page_link[page]:
-                # check if the parent page has any outgoing links
-                num_links = len(corpus[parent_page])
-                if num_links != 0:
-                    s += page_rank[parent_page] / num_links
-                else:
-                    s += page_rank[parent_page] / n
-
-            new_rank += damping_factor * s
-            if abs(page_rank[page] - new_rank) > 0.001:
-                ok = False
-            page_rank[page] = new_rank
+            page_link[index[page2]].append(i)
+            num_links[i] += 1
+
+    # pages without any outgoing links are treated as linking to every page
+    sinks = [i for i in range(n) if num_links[i] == 0]
+
+    rank = [1 / n] * n
+    while True:
+        # rank each page passes on through every one of its links
+        share = [
+            rank[i] / num_links[i] if num_links[i] != 0 else 0
+            for i in range(n)
+        ]
+        sink_share = sum(rank[i] for i in sinks) / n
+
+        new_rank = [0] * n
+        for i in range(n):
+            s = sink_share
+            for parent in page_link[i]:
+                s += share[parent]
+
+            new_rank[i] = (1 - damping_factor) / n + damping_factor * s
+
+        # stop once no page rank changed by more than the threshold
+        delta = max(abs(new - old) for new, old in zip(new_rank, rank))
+        rank = new_rank
+        if delta <= THRESHOLD:
+            break
+
+    page_rank = {page: rank[i] for i, page in enumerate(pages)}
 
     # print(page_rank)
     return page_rank